@@ -6,12 +6,16 @@ import torch
 from diffusers import DiffusionPipeline
 
 import tensorrt_llm
+from tensorrt_llm._utils import mpi_broadcast
 from tensorrt_llm.builder import Builder
 from tensorrt_llm.mapping import Mapping
+from tensorrt_llm.models.modeling_utils import QuantConfig
 from tensorrt_llm.models.unet.pp.unet_pp import DistriUNetPP
 from tensorrt_llm.models.unet.unet_2d_condition import UNet2DConditionModel
 from tensorrt_llm.models.unet.weights import load_from_hf_unet
 from tensorrt_llm.network import net_guard
+from tensorrt_llm.quantization import QuantAlgo
+from tensorrt_llm.quantization.quantize import quantize
 
 parser = argparse.ArgumentParser(description='build the UNet TensorRT engine.')
 parser.add_argument('--size', type=int, default=1024, help='image size')
@@ -19,6 +23,29 @@ parser.add_argument('--output_dir',
                     type=str,
                     default=None,
                     help='output directory')
+parser.add_argument(
+    '--deep_cache',
+    action='store_true',
+    help='also build a shallow UNet engine which reuses cached deep features '
+    '(DeepCache), enabled at runtime by run_sdxl.py --cache_interval')
+parser.add_argument(
+    '--cfg_cache',
+    action='store_true',
+    help='also build a batch 1 UNet engine which only evaluates the '
+    'conditional branch, enabled at runtime by run_sdxl.py --cfg_cache_start')
+parser.add_argument(
+    '--mid_block_skip',
+    action='store_true',
+    help='also build a UNet engine which reuses the cached mid block residual '
+    'of the last full step, enabled at runtime by run_sdxl.py '
+    '--mid_block_skip_warmup')
+parser.add_argument(
+    '--precision',
+    type=str,
+    default='float16',
+    choices=['float16', 'fp8'],
+    help='fp8 quantizes the linear layers of the transformer blocks, '
+    'the convolutions stay in float16')
 
 args = parser.parse_args()
 
@@ -27,6 +54,10 @@ sample_size = size // 8
 
 world_size = tensorrt_llm.mpi_world_size()
 rank = tensorrt_llm.mpi_rank()
+# With batch parallelism the two guidance branches already run concurrently
+# on different ranks.
+assert not args.cfg_cache or world_size == 1, \
+    'CFG cache is not supported with batch parallelism'
 output_dir = f'sdxl_s{size}_w{world_size}' if args.output_dir is None else args.output_dir
 if rank == 0 and not os.path.exists(output_dir):
     os.makedirs(output_dir)
@@ -45,100 +76,222 @@ torch.cuda.set_device(tensorrt_llm.mpi_rank())
 
 tensorrt_llm.logger.set_level('verbose')
 builder = Builder()
-builder_config = builder.create_builder_config(
-    name='UNet2DConditionModel',
-    precision='float16',
-    timing_cache='model.cache',
-    profiling_verbosity='detailed',
-    tensor_parallel=world_size,
-    precision_constraints=
-    None,  # do not use obey or the precision error will be too large
-)
+
+
+def create_builder_config():
+    return builder.create_builder_config(
+        name='UNet2DConditionModel',
+        precision='float16',
+        timing_cache='model.cache',
+        profiling_verbosity='detailed',
+        tensor_parallel=world_size,
+        precision_constraints=
+        None,  # do not use obey or the precision error will be too large
+        quant_mode=quant_config.quant_mode,
+    )
+
 
 pipeline = DiffusionPipeline.from_pretrained(
     "stabilityai/stable-diffusion-xl-base-1.0", torch_dtype=torch.float16)
-model = UNet2DConditionModel(
-    sample_size=sample_size,
-    in_channels=4,
-    out_channels=4,
-    center_input_sample=False,
-    flip_sin_to_cos=True,
-    freq_shift=0,
-    down_block_types=("DownBlock2D", "CrossAttnDownBlock2D",
-                      "CrossAttnDownBlock2D"),
-    up_block_types=("CrossAttnUpBlock2D", "CrossAttnUpBlock2D", "UpBlock2D"),
-    block_out_channels=(320, 640, 1280),
-    layers_per_block=2,
-    downsample_padding=1,
-    mid_block_scale_factor=1.0,
-    act_fn="silu",
-    norm_num_groups=32,
-    norm_eps=1e-5,
-    cross_attention_dim=2048,
-    attention_head_dim=[5, 10, 20],
-    addition_embed_type="text_time",
-    addition_time_embed_dim=256,
-    projection_class_embeddings_input_dim=2816,
-    transformer_layers_per_block=[1, 2, 10],
-    use_linear_projection=True,
-    dtype=trt.float16,
-)
-
-load_from_hf_unet(pipeline.unet, model)
-model = DistriUNetPP(model, mapping)
-
-# Module -> Network
-network = builder.create_network()
-network.plugin_config.to_legacy_setting()
-if mapping.world_size > 1:
-    network.plugin_config.set_nccl_plugin('float16')
-
-with net_guard(network):
-    # Prepare
-    network.set_named_parameters(model.named_parameters())
-
-    # Forward
-    sample = tensorrt_llm.Tensor(
-        name='sample',
-        dtype=trt.float16,
-        shape=[2, 4, sample_size, sample_size],
-    )
-    timesteps = tensorrt_llm.Tensor(
-        name='timesteps',
-        dtype=trt.float16,
-        shape=[
-            1,
-        ],
-    )
-    encoder_hidden_states = tensorrt_llm.Tensor(
-        name='encoder_hidden_states',
-        dtype=trt.float16,
-        shape=[2, 77, 2048],
-    )
-    text_embeds = tensorrt_llm.Tensor(
-        name='text_embeds',
-        dtype=trt.float16,
-        shape=[2, 1280],
-    )
-    time_ids = tensorrt_llm.Tensor(
-        name='time_ids',
+
+quant_config = QuantConfig()
+if args.precision == 'fp8':
+    # The time embedding projections only see a handful of rows, keep them
+    # in float16.
+    quant_config = QuantConfig(
+        quant_algo=QuantAlgo.FP8,
+        exclude_modules=['linear_1', 'linear_2', 'time_emb_proj'])
+
+    calib_prompts = [
+        "masterpiece, gouache painting, 1girl, distant view, lone boat, willow trees",
+        "a photo of an astronaut riding a horse on mars",
+        "flowers, rabbit",
+        "a cyberpunk city street at night, neon lights, rain",
+    ]
+
+    def record_input_amax(module, inputs, output):
+        amax = inputs[0].detach().abs().amax().float().item()
+        module.input_amax = max(getattr(module, 'input_amax', 0.0), amax)
+
+    linears = {
+        name: module
+        for name, module in pipeline.unet.named_modules()
+        if isinstance(module, torch.nn.Linear)
+    }
+    # Calibrate once on rank 0 with fixed latents, so that the activation
+    # scales are reproducible and identical in the engines of all ranks.
+    input_amax = None
+    if rank == 0:
+        handles = [
+            module.register_forward_hook(record_input_amax)
+            for module in linears.values()
+        ]
+        pipeline.to('cuda')
+        for seed, prompt in enumerate(calib_prompts):
+            pipeline(prompt=prompt,
+                     num_inference_steps=20,
+                     height=size,
+                     width=size,
+                     generator=torch.Generator('cuda').manual_seed(seed),
+                     output_type='latent')
+        for handle in handles:
+            handle.remove()
+        pipeline.to('cpu')
+        torch.cuda.empty_cache()
+        input_amax = {
+            name: module.input_amax
+            for name, module in linears.items()
+            if hasattr(module, 'input_amax')
+        }
+    if world_size > 1:
+        input_amax = mpi_broadcast(input_amax)
+    for name, amax in input_amax.items():
+        linears[name].input_amax = amax
+
+
+def create_model():
+    model = UNet2DConditionModel(
+        sample_size=sample_size,
+        in_channels=4,
+        out_channels=4,
+        center_input_sample=False,
+        flip_sin_to_cos=True,
+        freq_shift=0,
+        down_block_types=("DownBlock2D", "CrossAttnDownBlock2D",
+                          "CrossAttnDownBlock2D"),
+        up_block_types=("CrossAttnUpBlock2D", "CrossAttnUpBlock2D",
+                        "UpBlock2D"),
+        block_out_channels=(320, 640, 1280),
+        layers_per_block=2,
+        downsample_padding=1,
+        mid_block_scale_factor=1.0,
+        act_fn="silu",
+        norm_num_groups=32,
+        norm_eps=1e-5,
+        cross_attention_dim=2048,
+        # number of heads per block, giving heads of size 64 which the fused
+        # MHA kernels support
+        attention_head_dim=[5, 10, 20],
+        addition_embed_type="text_time",
+        addition_time_embed_dim=256,
+        projection_class_embeddings_input_dim=2816,
+        transformer_layers_per_block=[1, 2, 10],
+        use_linear_projection=True,
         dtype=trt.float16,
-        shape=[2, 6],
     )
+    if quant_config.quant_algo is not None:
+        model = quantize(model, quant_config)
+
+    load_from_hf_unet(pipeline.unet, model)
+    return DistriUNetPP(model, mapping)
+
+
+def build_engine(engine_name,
+                 batch_size=2,
+                 return_cached_feature=False,
+                 cached_feature_shape=None,
+                 return_mid_block_cache=False,
+                 mid_block_cache_shape=None):
+    # Parameters are bound to the network they are first used in, so every
+    # engine gets its own model instance.
+    model = create_model()
+
+    # Module -> Network
+    network = builder.create_network()
+    network.plugin_config.to_legacy_setting()
+    if mapping.world_size > 1:
+        network.plugin_config.set_nccl_plugin('float16')
+
+    cache_shapes = {}
+    with net_guard(network):
+        # Prepare
+        network.set_named_parameters(model.named_parameters())
+
+        # Forward
+        sample = tensorrt_llm.Tensor(
+            name='sample',
+            dtype=trt.float16,
+            shape=[batch_size, 4, sample_size, sample_size],
+        )
+        timesteps = tensorrt_llm.Tensor(
+            name='timesteps',
+            dtype=trt.float16,
+            shape=[
+                1,
+            ],
+        )
+        encoder_hidden_states = tensorrt_llm.Tensor(
+            name='encoder_hidden_states',
+            dtype=trt.float16,
+            shape=[batch_size, 77, 2048],
+        )
+        # add_embedding(concat([text_embeds, add_time_proj(time_ids)])) is
+        # constant over the denoising steps and computed by the pipeline
+        aug_emb = tensorrt_llm.Tensor(
+            name='aug_emb',
+            dtype=trt.float16,
+            shape=[batch_size, 1280],
+        )
+        cached_feature = None
+        if cached_feature_shape is not None:
+            cached_feature = tensorrt_llm.Tensor(
+                name='cached_feature',
+                dtype=trt.float16,
+                shape=cached_feature_shape,
+            )
+        mid_block_cache = None
+        if mid_block_cache_shape is not None:
+            mid_block_cache = tensorrt_llm.Tensor(
+                name='mid_block_cache',
+                dtype=trt.float16,
+                shape=mid_block_cache_shape,
+            )
+
+        output = model(sample,
+                       timesteps,
+                       encoder_hidden_states,
+                       cached_feature=cached_feature,
+                       return_cached_feature=return_cached_feature,
+                       aug_emb=aug_emb,
+                       mid_block_cache=mid_block_cache,
+                       return_mid_block_cache=return_mid_block_cache)
+
+        # Mark outputs
+        output_dtype = trt.float16
+        if return_cached_feature or return_mid_block_cache:
+            output, *caches = output
+            cache_names = []
+            if return_cached_feature:
+                cache_names.append('deep_feature')
+            if return_mid_block_cache:
+                cache_names.append('mid_block_cache')
+            for name, cache in zip(cache_names, caches):
+                cache.mark_output(name, output_dtype)
+                cache_shapes[name] = list(cache.shape)
+        output.mark_output('pred', output_dtype)
 
-    output = model(sample, timesteps, encoder_hidden_states, text_embeds,
-                   time_ids)
+    # Network -> Engine
+    builder_config = create_builder_config()
+    engine = builder.build_engine(network, builder_config)
+    assert engine is not None, f'Failed to build engine {engine_name}.'
 
-    # Mark outputs
-    output_dtype = trt.float16
-    output.mark_output('pred', output_dtype)
+    engine_path = os.path.join(output_dir, engine_name)
+    with open(engine_path, 'wb') as f:
+        f.write(engine)
+    return builder_config, cache_shapes
 
-# Network -> Engine
-engine = builder.build_engine(network, builder_config)
-assert engine is not None, 'Failed to build engine.'
 
-engine_name = f'sdxl_unet_s{size}_w{world_size}_r{rank}.engine'
-engine_path = os.path.join(output_dir, engine_name)
-with open(engine_path, 'wb') as f:
-    f.write(engine)
+builder_config, cache_shapes = build_engine(
+    f'sdxl_unet_s{size}_w{world_size}_r{rank}.engine',
+    return_cached_feature=args.deep_cache,
+    return_mid_block_cache=args.mid_block_skip)
+if args.deep_cache:
+    build_engine(f'sdxl_unet_shallow_s{size}_w{world_size}_r{rank}.engine',
+                 cached_feature_shape=cache_shapes['deep_feature'])
+if args.mid_block_skip:
+    build_engine(f'sdxl_unet_nomid_s{size}_w{world_size}_r{rank}.engine',
+                 mid_block_cache_shape=cache_shapes['mid_block_cache'])
+if args.cfg_cache:
+    build_engine(f'sdxl_unet_cond_s{size}_w{world_size}_r{rank}.engine',
+                 batch_size=1)
 builder.save_config(builder_config, os.path.join(output_dir, 'config.json'))
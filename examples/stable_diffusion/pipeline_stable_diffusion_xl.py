@@ -15,6 +15,8 @@
 import inspect
 import json
 import os
+import re
+from collections import defaultdict
 from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 import tensorrt as trt
@@ -76,6 +78,24 @@ EXAMPLE_DOC_STRING = """
 """
 
 
+class UNetProfiler(trt.IProfiler):
+    """Accumulates the UNet engine layer times per top level UNet module."""
+
+    module_pattern = re.compile(
+        r'(time_proj|time_embedding|add_time_proj|add_embedding|conv_in|'
+        r'down_blocks/\d+|mid_block|up_blocks/\d+|conv_norm_out|conv_out)')
+
+    def __init__(self):
+        super().__init__()
+        self.results = defaultdict(float)
+
+    def report_layer_time(self, layer_name, ms):
+        # Fused layers are reported under the module of their first layer
+        match = self.module_pattern.search(layer_name)
+        module = match.group(1) if match is not None else 'others'
+        self.results[module] += ms
+
+
 # Copied from diffusers.pipelines.stable_diffusion.pipeline_stable_diffusion.rescale_noise_cfg
 def rescale_noise_cfg(noise_cfg, noise_pred_text, guidance_rescale=0.0):
     """
@@ -255,6 +275,11 @@ class StableDiffusionXLPipeline(
 
         self.execution_device = torch.device('cpu')
         self.engine = {}
+        self.cache_interval = 1
+        self.cfg_cache_start = None
+        self.mid_block_skip_warmup = None
+        self.profiler = None
+        self.cuda_graphs = {}
 
     def to(
         self,
@@ -268,7 +293,14 @@ class StableDiffusionXLPipeline(
         self.execution_device = torch_device
         return self
 
-    def prepare(self, path, size):
+    def prepare(self,
+                path,
+                size,
+                cache_interval=1,
+                cfg_cache_start=None,
+                cfg_cache_stride=2,
+                mid_block_skip_warmup=None,
+                use_cuda_graph=False):
         self.unet.cpu()
         torch.cuda.empty_cache()
 
@@ -292,33 +324,138 @@ class StableDiffusionXLPipeline(
         assert world_size == runtime_world_size, f'Engine world size ({world_size}) != Runtime world size ({runtime_world_size})'
         runtime_rank = tensorrt_llm.mpi_rank() if world_size > 1 else 0
         torch.cuda.set_device(runtime_rank)
-
-        serialize_file = f'sdxl_unet_s{size}_w{world_size}_r{runtime_rank}.engine'
-        serialize_path = os.path.join(path, serialize_file)
         self.stream = torch.cuda.current_stream().cuda_stream
-        print(f'Loading engine from {serialize_path}')
-        with open(serialize_path, 'rb') as f:
-            engine_buffer = f.read()
-        print(f'Creating session from engine')
-        self.session = Session.from_serialized_engine(engine_buffer)
-
-        output_info = self.session.infer_shapes([
-            TensorInfo('sample', trt.DataType.HALF,
-                       [2, 4, size // 8, size // 8]),
-            TensorInfo('timesteps', trt.DataType.HALF, [
-                1,
-            ]),
-            TensorInfo('encoder_hidden_states', trt.DataType.HALF,
-                       [2, 77, 2048]),
-            TensorInfo('text_embeds', trt.DataType.HALF, [2, 1280]),
-            TensorInfo('time_ids', trt.DataType.HALF, [2, 6]),
-        ])
-        self.outputs = {
-            t.name: torch.empty(tuple(t.shape),
-                                dtype=trt_dtype_to_torch(t.dtype),
-                                device='cuda')
-            for t in output_info
-        }
+
+        def load_session(name, input_info):
+            serialize_file = f'{name}_s{size}_w{world_size}_r{runtime_rank}.engine'
+            serialize_path = os.path.join(path, serialize_file)
+            print(f'Loading engine from {serialize_path}')
+            with open(serialize_path, 'rb') as f:
+                engine_buffer = f.read()
+            print(f'Creating session from engine')
+            session = Session.from_serialized_engine(engine_buffer)
+
+            output_info = session.infer_shapes(input_info)
+            outputs = {
+                t.name: torch.empty(tuple(t.shape),
+                                    dtype=trt_dtype_to_torch(t.dtype),
+                                    device='cuda')
+                for t in output_info
+            }
+            return session, outputs
+
+        def get_input_info(batch_size):
+            return [
+                TensorInfo('sample', trt.DataType.HALF,
+                           [batch_size, 4, size // 8, size // 8]),
+                TensorInfo('timesteps', trt.DataType.HALF, [
+                    1,
+                ]),
+                TensorInfo('encoder_hidden_states', trt.DataType.HALF,
+                           [batch_size, 77, 2048]),
+                TensorInfo('aug_emb', trt.DataType.HALF, [batch_size, 1280]),
+            ]
+
+        input_info = get_input_info(2)
+        self.session, self.outputs = load_session('sdxl_unet', input_info)
+        sessions = [(self.session, self.outputs, input_info)]
+
+        # DeepCache: the full engine also outputs the input feature of the
+        # last up block, which the shallow engine reuses on the other steps.
+        self.cache_interval = cache_interval
+        if cache_interval > 1:
+            assert 'deep_feature' in self.outputs, \
+                'DeepCache requires engines built with --deep_cache'
+            feature = self.outputs['deep_feature']
+            shallow_input_info = input_info + [
+                TensorInfo('cached_feature', trt.DataType.HALF,
+                           list(feature.shape)),
+            ]
+            self.shallow_session, self.shallow_outputs = load_session(
+                'sdxl_unet_shallow', shallow_input_info)
+            sessions.append((self.shallow_session, self.shallow_outputs,
+                             shallow_input_info))
+
+        # CFG cache: from step cfg_cache_start on, only the conditional branch
+        # is evaluated on steps not divisible by cfg_cache_stride, with the
+        # unconditional prediction extrapolated from the last full step.
+        self.cfg_cache_start = cfg_cache_start
+        self.cfg_cache_stride = cfg_cache_stride
+        if cfg_cache_start is not None:
+            assert cfg_cache_stride >= 2, \
+                'cfg_cache_stride must be at least 2 to skip any step'
+            assert world_size == 1, \
+                'CFG cache is not supported with batch parallelism'
+            assert cache_interval == 1, \
+                'CFG cache can not be combined with DeepCache'
+            cond_input_info = get_input_info(1)
+            self.cond_session, self.cond_outputs = load_session(
+                'sdxl_unet_cond', cond_input_info)
+            sessions.append(
+                (self.cond_session, self.cond_outputs, cond_input_info))
+
+        # Mid-block skip: after mid_block_skip_warmup steps, every odd step
+        # adds the mid block residual recorded by the previous full step
+        # instead of evaluating the mid block.
+        self.mid_block_skip_warmup = mid_block_skip_warmup
+        if mid_block_skip_warmup is not None:
+            assert 'mid_block_cache' in self.outputs, \
+                'Mid-block skip requires engines built with --mid_block_skip'
+            assert cache_interval == 1 and cfg_cache_start is None, \
+                'Mid-block skip can not be combined with DeepCache or CFG cache'
+            nomid_input_info = input_info + [
+                TensorInfo('mid_block_cache', trt.DataType.HALF,
+                           list(self.outputs['mid_block_cache'].shape)),
+            ]
+            self.nomid_session, self.nomid_outputs = load_session(
+                'sdxl_unet_nomid', nomid_input_info)
+            sessions.append(
+                (self.nomid_session, self.nomid_outputs, nomid_input_info))
+
+        # Every session is run once on zero inputs. The first enqueue does
+        # lazy initialization (workspace allocation, cuBLAS and cuDNN handles)
+        # which would otherwise land in the first denoising step, and which
+        # can not be captured in a CUDA graph.
+        static_sessions = []
+        for session, outputs, info in sessions:
+            static_inputs = {
+                t.name: torch.zeros(tuple(t.shape),
+                                    dtype=trt_dtype_to_torch(t.dtype),
+                                    device='cuda')
+                for t in info
+            }
+            # read the caches in place from the outputs of the full engine
+            for name, output_name in (('cached_feature', 'deep_feature'),
+                                      ('mid_block_cache', 'mid_block_cache')):
+                if name in static_inputs:
+                    static_inputs[name] = self.outputs[output_name]
+            ok = session.run(static_inputs, outputs, self.stream)
+            assert ok, "Runtime execution failed"
+            static_sessions.append((session, outputs, static_inputs))
+        torch.cuda.synchronize()
+
+        # CUDA graphs: every session is captured once on static input buffers,
+        # the denoising loop only copies the new inputs in and replays it.
+        self.cuda_graphs = {}
+        if use_cuda_graph:
+            for session, outputs, static_inputs in static_sessions:
+                graph = torch.cuda.CUDAGraph()
+                with torch.cuda.graph(graph):
+                    ok = session.run(static_inputs, outputs,
+                                     torch.cuda.current_stream().cuda_stream)
+                assert ok, "CUDA graph capture failed"
+                self.cuda_graphs[session] = (graph, static_inputs)
+
+    def enable_profiler(self):
+        assert not self.cuda_graphs, \
+            'Layer profiling is not supported with CUDA graphs'
+        self.profiler = UNetProfiler()
+        for name in ('session', 'shallow_session', 'cond_session',
+                     'nomid_session'):
+            session = getattr(self, name, None)
+            if session is not None:
+                session.context.profiler = self.profiler
+                session.context.enqueue_emits_profile = False
 
     # Copied from diffusers.pipelines.stable_diffusion.pipeline_stable_diffusion.StableDiffusionPipeline.enable_vae_slicing
     def enable_vae_slicing(self):
@@ -862,6 +999,16 @@ class StableDiffusionXLPipeline(
         assert emb.shape == (w.shape[0], embedding_dim)
         return emb
 
+    def get_aug_embed(self, text_embeds, time_ids):
+        time_embeds = self.unet.add_time_proj(time_ids.flatten().to(
+            self.unet.device))
+        time_embeds = time_embeds.reshape((text_embeds.shape[0], -1))
+        add_embeds = torch.concat(
+            [text_embeds.to(self.unet.device), time_embeds], dim=-1)
+        add_embeds = add_embeds.to(self.unet.dtype)
+        aug_emb = self.unet.add_embedding(add_embeds)
+        return aug_emb.to(device=self.execution_device, dtype=torch.float16)
+
     @property
     def guidance_scale(self):
         return self._guidance_scale
@@ -1112,6 +1259,10 @@ class StableDiffusionXLPipeline(
         self._clip_skip = clip_skip
         self._cross_attention_kwargs = cross_attention_kwargs
         self._denoising_end = denoising_end
+        # The engine is built for the concatenated [uncond, cond] batch, so
+        # both guidance branches are computed by a single UNet launch.
+        assert self.do_classifier_free_guidance, \
+            'The UNet engine requires classifier free guidance (guidance_scale > 1)'
 
         # 2. Define call parameters
         if prompt is not None and isinstance(prompt, str):
@@ -1243,7 +1394,12 @@ class StableDiffusionXLPipeline(
                 embedding_dim=self.unet.config.time_cond_proj_dim).to(
                     device=device, dtype=latents.dtype)
 
+        # 10. Precompute the added conditioning embedding, it does not depend
+        # on the timestep
+        aug_emb = self.get_aug_embed(add_text_embeds, add_time_ids)
+
         self._num_timesteps = len(timesteps)
+        uncond_residual = None
         with self.progress_bar(total=num_inference_steps) as progress_bar:
             for i, t in enumerate(timesteps):
                 # expand the latents if we are doing classifier free guidance
@@ -1267,17 +1423,52 @@ class StableDiffusionXLPipeline(
                     'sample': latent_model_input,
                     'timesteps': t.unsqueeze(0),
                     'encoder_hidden_states': prompt_embeds,
-                    'text_embeds': add_text_embeds,
-                    'time_ids': add_time_ids,
+                    'aug_emb': aug_emb,
                 }
-                ok = self.session.run(feed_dict, self.outputs, self.stream)
-                assert ok, "Runtime execution failed"
-                noise_pred = self.outputs['pred']
+                cfg_cached = (self.cfg_cache_start is not None
+                              and i >= self.cfg_cache_start
+                              and i % self.cfg_cache_stride != 0
+                              and uncond_residual is not None)
+                if cfg_cached:
+                    # only the conditional half of the batch
+                    feed_dict = {
+                        name: tensor[1:]
+                        for name, tensor in feed_dict.items()
+                    }
+                    feed_dict['timesteps'] = t.unsqueeze(0)
+                    session, outputs = self.cond_session, self.cond_outputs
+                elif self.cache_interval > 1 and i % self.cache_interval != 0:
+                    feed_dict['cached_feature'] = self.outputs['deep_feature']
+                    session, outputs = self.shallow_session, self.shallow_outputs
+                elif (self.mid_block_skip_warmup is not None
+                      and i > self.mid_block_skip_warmup and i % 2 == 1):
+                    feed_dict['mid_block_cache'] = self.outputs[
+                        'mid_block_cache']
+                    session, outputs = self.nomid_session, self.nomid_outputs
+                else:
+                    session, outputs = self.session, self.outputs
+                if session in self.cuda_graphs:
+                    graph, static_inputs = self.cuda_graphs[session]
+                    for name, tensor in feed_dict.items():
+                        if static_inputs[name].data_ptr() != tensor.data_ptr():
+                            static_inputs[name].copy_(tensor)
+                    graph.replay()
+                else:
+                    ok = session.run(feed_dict, outputs, self.stream)
+                    assert ok, "Runtime execution failed"
+                noise_pred = outputs['pred']
                 torch.cuda.synchronize()
+                if self.profiler is not None:
+                    session.context.report_to_profiler()
 
                 # perform guidance
                 if self.do_classifier_free_guidance:
-                    noise_pred_uncond, noise_pred_text = noise_pred.chunk(2)
+                    if cfg_cached:
+                        noise_pred_text = noise_pred
+                        noise_pred_uncond = noise_pred_text + uncond_residual
+                    else:
+                        noise_pred_uncond, noise_pred_text = noise_pred.chunk(2)
+                        uncond_residual = noise_pred_uncond - noise_pred_text
                     noise_pred = noise_pred_uncond + self.guidance_scale * \
                         (noise_pred_text - noise_pred_uncond)
 
@@ -3271,6 +3271,84 @@ def group_norm(input: Tensor,
     return y
 
 
+def group_norm_silu(input: Tensor,
+                    num_groups: int,
+                    weight: Optional[Tensor] = None,
+                    bias: Optional[Tensor] = None,
+                    eps: float = 1e-05,
+                    residual: Optional[Tensor] = None) -> Tensor:
+    '''
+    Add a group normalization followed by a SiLU activation.
+
+    Unlike group_norm, the affine transform and the activation are applied
+    on the grouped view right after the normalization layer, without an
+    intervening reshape, so that TensorRT fuses them into the normalization
+    kernel instead of writing the normalized tensor back to memory before
+    the activation. For the same reason the optional residual is added on
+    the grouped view, directly before the normalization.
+
+    Parameters:
+        input : Tensor
+            The input tensor, of shape [N, C, ...]. Its shape must be static.
+
+        num_groups : int
+            The number of groups to split the channels into.
+
+        weight : Optional[Tensor]
+            The per-channel scale, of shape [C].
+
+        bias : Optional[Tensor]
+            The per-channel shift, of shape [C].
+
+        eps : float
+            The epsilon term added to the variance.
+
+        residual : Optional[Tensor]
+            A tensor added to the input before the normalization. It has C
+            channels and the other dimensions may broadcast, e.g. [N, C, 1, 1].
+
+    Returns:
+        The tensor silu(group_norm(input + residual) * weight + bias).
+    '''
+    assert not input.is_dynamic()
+    input_shape = list(input.size())
+    num_channels = input_shape[1]
+    group_size = num_channels // num_groups
+
+    def to_groups(tensor):
+        tensor_shape = list(tensor.size())
+        assert tensor_shape[1] == num_channels
+        return tensor.view(tensor_shape[:1] + [num_groups, group_size] +
+                           tensor_shape[2:])
+
+    x = to_groups(input)
+    if residual is not None:
+        x = x + to_groups(residual)
+
+    # instance norm
+    w_shape = [1, num_groups] + [1 for i in range(x.ndim() - 2)]
+    instance_weight = constant(np.ones(w_shape, dtype=trt_dtype_to_np(x.dtype)))
+    instance_bias = constant(np.zeros(w_shape, dtype=trt_dtype_to_np(x.dtype)))
+    axes_mask = 0
+    for i in range(2, x.ndim()):
+        axes_mask |= 1 << i
+    layer = default_trtnet().add_normalization(x.trt_tensor,
+                                               instance_weight.trt_tensor,
+                                               instance_bias.trt_tensor,
+                                               axes_mask)
+    layer.epsilon = eps
+    y = _create_tensor(layer.get_output(0), layer)
+
+    affine_shape = [1, num_groups, group_size] + [1] * (x.ndim() - 3)
+    if weight is not None:
+        y = y * weight.view(affine_shape)
+    if bias is not None:
+        y = y + bias.view(affine_shape)
+    y = silu(y)
+
+    return y.view(input_shape)
+
+
 def softplus(input: Tensor, beta: float, threshold: float) -> Tensor:
     '''
     Add the softplus activation base on PyTorch definition.
@@ -12,7 +12,7 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from .activation import Mish
+from .activation import Mish, SiLU
 from .attention import (Attention, AttentionMaskType, AttentionParams,
                         BertAttention, BlockSparseAttnParams, CogVLMAttention,
                         KeyValueCacheParams, PositionEmbeddingType,
@@ -25,7 +25,7 @@ from .linear import (ColumnLinear, Linear, ParallelLMHead, QKVColumnLinear,
 from .lora import Lora, LoraParams, LoraRuntimeParams
 from .mlp import MLP, FusedGatedMLP, GatedMLP
 from .moe import MOE, MoeConfig
-from .normalization import GroupNorm, LayerNorm, RmsNorm
+from .normalization import GroupNorm, GroupNormSiLU, LayerNorm, RmsNorm
 from .pooling import AvgPool2d
 from .recurrent import FusedRgLru, GroupedLinear, Recurrent, RgLru
 from .ssm import Mamba
@@ -44,6 +44,7 @@ __all__ = [
     'BertAttention',
     'CogVLMAttention',
     'GroupNorm',
+    'GroupNormSiLU',
     'Embedding',
     'PromptTuningEmbedding',
     'Conv2d',
@@ -51,6 +52,7 @@ __all__ = [
     'Conv1d',
     'AvgPool2d',
     'Mish',
+    'SiLU',
     'MLP',
     'GatedMLP',
     'FusedGatedMLP',
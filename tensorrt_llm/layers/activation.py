@@ -12,7 +12,7 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from ..functional import softplus, tanh
+from ..functional import silu, softplus, tanh
 from ..module import Module
 
 
@@ -20,3 +20,9 @@ class Mish(Module):
 
     def forward(self, input):
         return input * tanh(softplus(input, beta=1.0, threshold=20.0))
+
+
+class SiLU(Module):
+
+    def forward(self, input):
+        return silu(input)
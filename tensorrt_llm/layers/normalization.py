@@ -12,7 +12,7 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from ..functional import group_norm, layer_norm, rms_norm
+from ..functional import group_norm, group_norm_silu, layer_norm, rms_norm
 from ..module import Module
 from ..parameter import Parameter
 
@@ -104,3 +104,16 @@ class GroupNorm(Module):
         weight = None if self.weight is None else self.weight.value
         bias = None if self.bias is None else self.bias.value
         return group_norm(x, self.num_groups, weight, bias, self.eps)
+
+
+class GroupNormSiLU(GroupNorm):
+
+    def forward(self, x, residual=None):
+        weight = None if self.weight is None else self.weight.value
+        bias = None if self.bias is None else self.bias.value
+        return group_norm_silu(x,
+                               self.num_groups,
+                               weight,
+                               bias,
+                               self.eps,
+                               residual=residual)
@@ -15,8 +15,8 @@
 import math
 
 from ..._utils import fp32_array
-from ...functional import concat, constant, cos, exp, silu, sin
-from ...layers import Linear
+from ...functional import cast, concat, constant, cos, exp, sin
+from ...layers import Linear, SiLU
 from ...module import Module
 
 
@@ -65,6 +65,10 @@ def get_timestep_embedding(timesteps,
     # zero pad
     # if embedding_dim % 2 == 1:
     #     emb = torch.nn.functional.pad(emb, (0, 1, 0, 0))
+
+    # the sinusoids are computed in float32, cast once to the model dtype
+    if dtype is not None:
+        emb = cast(emb, dtype)
     return emb
 
 
@@ -76,7 +80,7 @@ class TimestepEmbedding(Module):
         self.linear_1 = Linear(channel, time_embed_dim, dtype=dtype)
         self.act = None
         if act_fn == "silu":
-            self.act = silu
+            self.act = SiLU()
         self.linear_2 = Linear(time_embed_dim, time_embed_dim, dtype=dtype)
 
     def forward(self, sample):
@@ -12,8 +12,8 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from ....functional import allreduce, pow, select, stack
-from ....layers import GroupNorm
+from ....functional import allreduce, pow, select, silu, stack
+from ....layers import GroupNorm, GroupNormSiLU
 from ....mapping import Mapping
 from ....module import Module
 
@@ -28,9 +28,11 @@ class DistriGroupNorm(Module):
         self.mapping = mapping
         self.module = module
 
-    def forward(self, x, *args, **kwargs):
+    def forward(self, x, *args, residual=None, **kwargs):
         mapping = self.mapping
         module = self.module
+        if residual is not None:
+            x = x + residual
         n, c, h, w = x.shape
         num_groups = module.num_groups
         group_size = c // num_groups
@@ -53,5 +55,7 @@ class DistriGroupNorm(Module):
         if module.affine:
             output = output * module.weight.value.view([1, -1, 1, 1])
             output = output + module.bias.value.view([1, -1, 1, 1])
+        if isinstance(module, GroupNormSiLU):
+            output = silu(output)
 
         return output
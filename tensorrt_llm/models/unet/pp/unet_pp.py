@@ -63,9 +63,18 @@ class DistriUNetPP(Module):
                 timesteps,
                 encoder_hidden_states,
                 text_embeds=None,
-                time_ids=None):
+                time_ids=None,
+                cached_feature=None,
+                return_cached_feature=False,
+                aug_emb=None,
+                mid_block_cache=None,
+                return_mid_block_cache=False):
         mapping = self.mapping
         b, c, h, w = sample.shape
+        # The cached features stay local to each rank, only the prediction
+        # needs to be gathered.
+        return_cache = return_cached_feature or return_mid_block_cache
+        caches = []
 
         if mapping.world_size == 1:
             output = self.model(
@@ -74,7 +83,14 @@ class DistriUNetPP(Module):
                 encoder_hidden_states,
                 text_embeds=text_embeds,
                 time_ids=time_ids,
+                cached_feature=cached_feature,
+                return_cached_feature=return_cached_feature,
+                aug_emb=aug_emb,
+                mid_block_cache=mid_block_cache,
+                return_mid_block_cache=return_mid_block_cache,
             )
+            if return_cache:
+                output, *caches = output
         elif mapping.pp_size > 1:
             assert b == 2 and mapping.pp_size == 2
             batch_idx = mapping.pp_rank
@@ -94,13 +110,24 @@ class DistriUNetPP(Module):
                 t_shape = time_ids.shape
                 # time_ids[batch_idx : batch_idx + 1]
                 time_ids = slice(time_ids, [batch_idx, 0], [1, t_shape[1]])
+            if aug_emb is not None:
+                a_shape = aug_emb.shape
+                # aug_emb[batch_idx : batch_idx + 1]
+                aug_emb = slice(aug_emb, [batch_idx, 0], [1, a_shape[1]])
             output = self.model(
                 sample,
                 timesteps,
                 encoder_hidden_states,
                 text_embeds=text_embeds,
                 time_ids=time_ids,
+                cached_feature=cached_feature,
+                return_cached_feature=return_cached_feature,
+                aug_emb=aug_emb,
+                mid_block_cache=mid_block_cache,
+                return_mid_block_cache=return_mid_block_cache,
             )
+            if return_cache:
+                output, *caches = output
             output = allgather(
                 output,
                 [i for i in range(mapping.world_size)],
@@ -121,9 +148,18 @@ class DistriUNetPP(Module):
                 encoder_hidden_states,
                 text_embeds=text_embeds,
                 time_ids=time_ids,
+                cached_feature=cached_feature,
+                return_cached_feature=return_cached_feature,
+                aug_emb=aug_emb,
+                mid_block_cache=mid_block_cache,
+                return_mid_block_cache=return_mid_block_cache,
             )
+            if return_cache:
+                output, *caches = output
             output = allgather(output, mapping.tp_group, 2)
 
+        if return_cache:
+            return (output, *caches)
         return output
 
     @property
@@ -14,9 +14,9 @@
 # limitations under the License.
 from functools import partial
 
-from ...functional import avg_pool2d, interpolate, silu
-from ...layers import (AvgPool2d, Conv2d, ConvTranspose2d, GroupNorm, Linear,
-                       Mish)
+from ...functional import avg_pool2d, interpolate
+from ...layers import (AvgPool2d, Conv2d, ConvTranspose2d, GroupNorm,
+                       GroupNormSiLU, Linear, Mish, SiLU)
 from ...module import Module
 
 
@@ -147,11 +147,15 @@ class ResnetBlock2D(Module):
         if groups_out is None:
             groups_out = groups
 
-        self.norm1 = GroupNorm(num_groups=groups,
-                               num_channels=in_channels,
-                               eps=eps,
-                               affine=True,
-                               dtype=dtype)
+        # the norms are always followed by the nonlinearity, fuse them for silu
+        self.fuse_norm_act = non_linearity in ("swish", "silu")
+        norm_cls = GroupNormSiLU if self.fuse_norm_act else GroupNorm
+
+        self.norm1 = norm_cls(num_groups=groups,
+                              num_channels=in_channels,
+                              eps=eps,
+                              affine=True,
+                              dtype=dtype)
         self.conv1 = Conv2d(in_channels,
                             out_channels,
                             kernel_size=(3, 3),
@@ -166,11 +170,11 @@ class ResnetBlock2D(Module):
         else:
             self.time_emb_proj = None
 
-        self.norm2 = GroupNorm(num_groups=groups_out,
-                               num_channels=out_channels,
-                               eps=eps,
-                               affine=True,
-                               dtype=dtype)
+        self.norm2 = norm_cls(num_groups=groups_out,
+                              num_channels=out_channels,
+                              eps=eps,
+                              affine=True,
+                              dtype=dtype)
         self.conv2 = Conv2d(out_channels,
                             out_channels,
                             kernel_size=(3, 3),
@@ -178,12 +182,10 @@ class ResnetBlock2D(Module):
                             padding=(1, 1),
                             dtype=dtype)
 
-        if non_linearity == "swish":
-            self.nonlinearity = lambda x: silu(x)
+        if non_linearity in ("swish", "silu"):
+            self.nonlinearity = SiLU()
         elif non_linearity == "mish":
             self.nonlinearity = Mish()
-        elif non_linearity == "silu":
-            self.nonlinearity = silu
 
         self.upsample = self.downsample = None
         #TODO (guomingz) add the fir kernel supporting.
@@ -222,7 +224,8 @@ class ResnetBlock2D(Module):
     def forward(self, input_tensor, temb):
         hidden_states = input_tensor
         hidden_states = self.norm1(hidden_states)
-        hidden_states = self.nonlinearity(hidden_states)
+        if not self.fuse_norm_act:
+            hidden_states = self.nonlinearity(hidden_states)
 
         if self.upsample is not None:
             input_tensor = self.upsample(input_tensor)
@@ -239,11 +242,14 @@ class ResnetBlock2D(Module):
             temb = temb.view(new_shape)
 
         assert self.time_embedding_norm == "default"
-        if temb is not None:
-            hidden_states = hidden_states + temb
-
-        hidden_states = self.norm2(hidden_states)
-        hidden_states = self.nonlinearity(hidden_states)
+        if self.fuse_norm_act:
+            # the temb add is fused into the normalization as well
+            hidden_states = self.norm2(hidden_states, residual=temb)
+        else:
+            if temb is not None:
+                hidden_states = hidden_states + temb
+            hidden_states = self.norm2(hidden_states)
+            hidden_states = self.nonlinearity(hidden_states)
         hidden_states = self.conv2(hidden_states)
 
         if self.conv_shortcut is not None:
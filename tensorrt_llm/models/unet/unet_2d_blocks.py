@@ -184,6 +184,7 @@ class UpBlock2D(Module):
                 hidden_states,
                 res_hidden_states_tuple,
                 temb=None,
+                encoder_hidden_states=None,
                 upsample_size=None):
         for resnet in self.resnets:
             # pop res hidden states
@@ -252,7 +253,7 @@ class DownBlock2D(Module):
         else:
             self.downsamplers = None
 
-    def forward(self, hidden_states, temb=None):
+    def forward(self, hidden_states, temb=None, encoder_hidden_states=None):
         output_states = ()
         for resnet in self.resnets:
             hidden_states = resnet(hidden_states, temb)
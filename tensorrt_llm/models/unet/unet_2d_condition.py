@@ -12,16 +12,39 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import dataclasses
 from typing import Optional
 
-from ...functional import cast, concat, silu
-from ...layers import Conv2d, GroupNorm
+import tensorrt as trt
+
+from ...functional import concat
+from ...layers import Conv2d, GroupNormSiLU
 from ...module import Module, ModuleList
 from .embeddings import TimestepEmbedding, Timesteps
 from .unet_2d_blocks import (UNetMidBlock2DCrossAttn, get_down_block,
                              get_up_block)
 
 
+@dataclasses.dataclass
+class BlockSpec:
+    channels: int
+    # number of attention heads, named as in diffusers
+    attention_head_dim: int
+    transformer_layers: int
+    down_block_type: str
+    up_block_type: str
+
+
+@dataclasses.dataclass
+class GlobalBlockConfig:
+    temb_channels: int
+    resnet_eps: float
+    resnet_act_fn: str
+    cross_attention_dim: int
+    use_linear_projection: bool
+    dtype: Optional[trt.DataType] = None
+
+
 class UNet2DConditionModel(Module):
 
     def __init__(
@@ -95,86 +118,105 @@ class UNet2DConditionModel(Module):
             transformer_layers_per_block = [transformer_layers_per_block
                                             ] * len(down_block_types)
 
+        # Per-block settings, the up blocks use them in reverse order
+        self._block_specs = [
+            BlockSpec(*spec)
+            for spec in zip(block_out_channels, attention_head_dim,
+                            transformer_layers_per_block, down_block_types,
+                            reversed(up_block_types))
+        ]
+        # Settings shared by all the blocks
+        self._block_config = GlobalBlockConfig(
+            temb_channels=time_embed_dim,
+            resnet_eps=norm_eps,
+            resnet_act_fn=act_fn,
+            cross_attention_dim=cross_attention_dim,
+            use_linear_projection=use_linear_projection,
+            dtype=dtype)
+        block_config = vars(self._block_config)
+
         # down
-        output_channel = block_out_channels[0]
-        for i, down_block_type in enumerate(down_block_types):
+        output_channel = self._block_specs[0].channels
+        for i, spec in enumerate(self._block_specs):
             input_channel = output_channel
-            output_channel = block_out_channels[i]
-            is_final_block = i == len(block_out_channels) - 1
+            output_channel = spec.channels
+            is_final_block = i == len(self._block_specs) - 1
 
             down_block = get_down_block(
-                down_block_type,
+                spec.down_block_type,
                 num_layers=layers_per_block,
-                transformer_layers_per_block=transformer_layers_per_block[i],
+                transformer_layers_per_block=spec.transformer_layers,
                 in_channels=input_channel,
                 out_channels=output_channel,
-                temb_channels=time_embed_dim,
                 add_downsample=not is_final_block,
-                resnet_eps=norm_eps,
-                resnet_act_fn=act_fn,
-                cross_attention_dim=cross_attention_dim,
-                attn_num_head_channels=attention_head_dim[i],
+                attn_num_head_channels=spec.attention_head_dim,
                 downsample_padding=downsample_padding,
-                use_linear_projection=use_linear_projection,
-                dtype=dtype)
+                **block_config)
             down_blocks.append(down_block)
         self.down_blocks = ModuleList(down_blocks)
         # mid
+        mid_spec = self._block_specs[-1]
         self.mid_block = UNetMidBlock2DCrossAttn(
-            in_channels=block_out_channels[-1],
-            temb_channels=time_embed_dim,
-            resnet_eps=norm_eps,
-            resnet_act_fn=act_fn,
+            in_channels=mid_spec.channels,
             output_scale_factor=mid_block_scale_factor,
-            transformer_layers_per_block=transformer_layers_per_block[-1],
+            transformer_layers_per_block=mid_spec.transformer_layers,
             resnet_time_scale_shift="default",
-            cross_attention_dim=cross_attention_dim,
-            attn_num_head_channels=attention_head_dim[-1],
+            attn_num_head_channels=mid_spec.attention_head_dim,
             resnet_groups=norm_num_groups,
-            use_linear_projection=use_linear_projection,
-            dtype=dtype,
+            **block_config,
         )
         # up
-        reversed_block_out_channels = list(reversed(block_out_channels))
-        reversed_attention_head_dim = list(reversed(attention_head_dim))
-        reversed_transformer_layers_per_block = list(
-            reversed(transformer_layers_per_block))
-        output_channel = reversed_block_out_channels[0]
-        for i, up_block_type in enumerate(up_block_types):
+        reversed_block_specs = list(reversed(self._block_specs))
+        output_channel = reversed_block_specs[0].channels
+        for i, spec in enumerate(reversed_block_specs):
             prev_output_channel = output_channel
-            output_channel = reversed_block_out_channels[i]
-            input_channel = reversed_block_out_channels[min(
+            output_channel = spec.channels
+            input_channel = reversed_block_specs[min(
                 i + 1,
-                len(block_out_channels) - 1)]
+                len(reversed_block_specs) - 1)].channels
 
-            is_final_block = i == len(block_out_channels) - 1
+            is_final_block = i == len(reversed_block_specs) - 1
 
             up_block = get_up_block(
-                up_block_type,
+                spec.up_block_type,
                 num_layers=layers_per_block + 1,
-                transformer_layers_per_block=
-                reversed_transformer_layers_per_block[i],
+                transformer_layers_per_block=spec.transformer_layers,
                 in_channels=input_channel,
                 out_channels=output_channel,
                 prev_output_channel=prev_output_channel,
-                temb_channels=time_embed_dim,
                 add_upsample=not is_final_block,
-                resnet_eps=norm_eps,
-                resnet_act_fn=act_fn,
-                cross_attention_dim=cross_attention_dim,
-                attn_num_head_channels=reversed_attention_head_dim[i],
-                use_linear_projection=use_linear_projection,
-                dtype=dtype,
+                attn_num_head_channels=spec.attention_head_dim,
+                **block_config,
             )
             up_blocks.append(up_block)
             prev_output_channel = output_channel
         self.up_blocks = ModuleList(up_blocks)
+        # Whether each block attends to encoder_hidden_states, fixed by the
+        # block types so the dispatch in forward needs no attribute checks.
+        self._down_has_attn = [
+            getattr(block, "attentions", None) is not None
+            for block in down_blocks
+        ]
+        self._up_has_attn = [
+            getattr(block, "attentions", None) is not None
+            for block in up_blocks
+        ]
+        # Skip connections consumed by each up block, as static ranges into
+        # the outputs of conv_in and the down blocks: one for conv_in, one
+        # per resnet and one per downsampler (all but the last down block).
+        num_res_samples = len(down_block_types) * (layers_per_block + 1)
+        self.upblock_skip_ranges = []
+        for up_block in up_blocks:
+            start = num_res_samples - len(up_block.resnets)
+            self.upblock_skip_ranges.append((start, num_res_samples))
+            num_res_samples = start
+        assert num_res_samples == 0
         # out
-        self.conv_norm_out = GroupNorm(num_channels=block_out_channels[0],
-                                       num_groups=norm_num_groups,
-                                       eps=norm_eps,
-                                       dtype=dtype)
-        self.conv_act = silu
+        # GroupNorm and the SiLU activation are fused into a single kernel
+        self.conv_norm_out = GroupNormSiLU(num_channels=block_out_channels[0],
+                                           num_groups=norm_num_groups,
+                                           eps=norm_eps,
+                                           dtype=dtype)
         self.conv_out = Conv2d(block_out_channels[0],
                                out_channels, (3, 3),
                                padding=(1, 1),
@@ -185,65 +227,89 @@ class UNet2DConditionModel(Module):
                 timesteps,
                 encoder_hidden_states,
                 text_embeds=None,
-                time_ids=None):
+                time_ids=None,
+                cached_feature=None,
+                return_cached_feature=False,
+                aug_emb=None,
+                mid_block_cache=None,
+                return_mid_block_cache=False):
         # time
         t_emb = self.time_proj(timesteps)
         emb = self.time_embedding(t_emb)
 
-        aug_emb = None
-        if self.addition_embed_type == "text_time":
+        # aug_emb only depends on the prompt, so it can be precomputed once
+        # for all the denoising steps instead of text_embeds and time_ids.
+        if aug_emb is None and self.addition_embed_type == "text_time":
             assert text_embeds is not None and time_ids is not None
             time_embeds = self.add_time_proj(time_ids.view([-1]))
             time_embeds = time_embeds.view([text_embeds.shape[0], -1])
             add_embeds = concat([text_embeds, time_embeds], dim=1)
-            add_embeds = cast(add_embeds, emb.dtype)
+            # add_time_proj returns the dtype of the model, text_embeds is
+            # expected in it as well, no need to cast the concatenation
+            assert add_embeds.dtype == emb.dtype
             aug_emb = self.add_embedding(add_embeds)
 
         emb = emb + aug_emb if aug_emb is not None else emb
 
         sample = self.conv_in(sample)
 
-        down_block_res_samples = (sample, )
-        for downsample_block in self.down_blocks:
+        # DeepCache: only the outermost down/up blocks are evaluated, the
+        # input of the last up block is reused from a previous full step.
+        down_blocks = self.down_blocks if cached_feature is None else [
+            self.down_blocks[0]
+        ]
 
-            if hasattr(
-                    downsample_block,
-                    "attentions") and downsample_block.attentions is not None:
+        down_block_res_samples = [sample]
+        for downsample_block, has_attn in zip(down_blocks, self._down_has_attn):
+            sample, res_samples = downsample_block(
+                hidden_states=sample,
+                temb=emb,
+                encoder_hidden_states=encoder_hidden_states
+                if has_attn else None)
+            down_block_res_samples.extend(res_samples)
 
-                sample, res_samples = downsample_block(
-                    hidden_states=sample,
-                    temb=emb,
-                    encoder_hidden_states=encoder_hidden_states)
-            else:
-                sample, res_samples = downsample_block(hidden_states=sample,
-                                                       temb=emb)
-            down_block_res_samples += res_samples
-
-        sample = self.mid_block(sample,
-                                emb,
-                                encoder_hidden_states=encoder_hidden_states)
-
-        for upsample_block in self.up_blocks:
-
-            res_samples = down_block_res_samples[-len(upsample_block.resnets):]
-            down_block_res_samples = down_block_res_samples[:-len(upsample_block
-                                                                  .resnets)]
-
-            if hasattr(upsample_block,
-                       "attentions") and upsample_block.attentions is not None:
-                sample = upsample_block(
-                    hidden_states=sample,
-                    temb=emb,
-                    res_hidden_states_tuple=res_samples,
-                    encoder_hidden_states=encoder_hidden_states,
-                )
+        if cached_feature is None:
+            # The residual added by the mid block changes slowly between
+            # neighbouring steps, so it can be broadcast from the last full
+            # step instead of evaluating the block (PAB).
+            if mid_block_cache is not None:
+                assert not return_mid_block_cache
+                sample = sample + mid_block_cache
             else:
-                sample = upsample_block(hidden_states=sample,
-                                        temb=emb,
-                                        res_hidden_states_tuple=res_samples)
+                mid_block_input = sample
+                sample = self.mid_block(
+                    sample, emb, encoder_hidden_states=encoder_hidden_states)
+                if return_mid_block_cache:
+                    mid_block_cache = sample - mid_block_input
+            up_block_ids = range(len(self.up_blocks))
+        else:
+            sample = cached_feature
+            up_block_ids = [len(self.up_blocks) - 1]
+
+        for i in up_block_ids:
+            if cached_feature is None and i == len(self.up_blocks) - 1:
+                feature = sample
+
+            upsample_block = self.up_blocks[i]
+            has_attn = self._up_has_attn[i]
+            start, end = self.upblock_skip_ranges[i]
+            res_samples = tuple(down_block_res_samples[start:end])
+            sample = upsample_block(
+                hidden_states=sample,
+                temb=emb,
+                res_hidden_states_tuple=res_samples,
+                encoder_hidden_states=encoder_hidden_states
+                if has_attn else None,
+            )
 
         sample = self.conv_norm_out(sample)
-        sample = self.conv_act(sample)
         sample = self.conv_out(sample)
 
-        return sample
+        outputs = (sample, )
+        if return_cached_feature:
+            assert cached_feature is None
+            outputs += (feature, )
+        if return_mid_block_cache:
+            assert cached_feature is None
+            outputs += (mid_block_cache, )
+        return outputs if len(outputs) > 1 else sample
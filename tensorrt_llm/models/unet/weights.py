@@ -15,8 +15,41 @@
 import time
 
 import numpy as np
+import torch
 
 from ...logger import logger
+from ...quantization.layers import FP8Linear
+
+FP8_E4M3_MAX = 448.0
+
+
+def update_linear_weight(dst, src):
+    """
+    Load one torch Linear, or a list of them fused along the output features,
+    into dst. FP8 layers additionally need the activation amax recorded on
+    the torch modules as `input_amax` during calibration.
+    """
+    src = src if isinstance(src, (list, tuple)) else [src]
+    if not isinstance(dst, FP8Linear):
+        if len(src) == 1:
+            dst.update_parameters(src[0])
+        else:
+            dst.weight.value = np.concatenate(
+                [m.weight.detach().cpu().numpy() for m in src])
+        return
+
+    weight = torch.cat([m.weight.detach().float() for m in src])
+    weights_scaling_factor = weight.abs().max() / FP8_E4M3_MAX
+    dst.weight.value = (weight / weights_scaling_factor).to(
+        torch.float8_e4m3fn).cpu()
+    dst.weights_scaling_factor.value = np.array([weights_scaling_factor.item()],
+                                                dtype=np.float32)
+    assert all(hasattr(m, 'input_amax') for m in src), \
+        'FP8 layers require calibrated activation ranges'
+    dst.activation_scaling_factor.value = np.array(
+        [max(m.input_amax for m in src) / FP8_E4M3_MAX], dtype=np.float32)
+    if dst.bias is not None:
+        dst.bias.value = torch.cat([m.bias.detach() for m in src]).cpu().numpy()
 
 
 def update_timestep_weight(src, dst):
@@ -38,27 +71,29 @@ def update_crossattn_downblock_2d_weight(src, dst):
 
 def update_transformer_2d_model_weight(gm, m):
     gm.norm.update_parameters(m.norm)
-    gm.proj_in.update_parameters(m.proj_in)
+    update_linear_weight(gm.proj_in, m.proj_in)
     for i in range(len(gm.transformer_blocks)):
-        gm.transformer_blocks[i].attn1.to_qkv.weight.value = np.concatenate(
-            (m.transformer_blocks[i].attn1.to_q.weight.detach().cpu().numpy(),
-             m.transformer_blocks[i].attn1.to_k.weight.detach().cpu().numpy(),
-             m.transformer_blocks[i].attn1.to_v.weight.detach().cpu().numpy()))
-        gm.transformer_blocks[i].attn1.to_out.update_parameters(
-            m.transformer_blocks[i].attn1.to_out[0])
-
-        gm.transformer_blocks[i].attn2.to_q.update_parameters(
-            m.transformer_blocks[i].attn2.to_q)
-        gm.transformer_blocks[i].attn2.to_kv.weight.value = np.concatenate(
-            (m.transformer_blocks[i].attn2.to_k.weight.detach().cpu().numpy(),
-             m.transformer_blocks[i].attn2.to_v.weight.detach().cpu().numpy()))
-        gm.transformer_blocks[i].attn2.to_out.update_parameters(
-            m.transformer_blocks[i].attn2.to_out[0])
-
-        gm.transformer_blocks[i].ff.proj_in.update_parameters(
-            m.transformer_blocks[i].ff.net[0].proj)
-        gm.transformer_blocks[i].ff.proj_out.update_parameters(
-            m.transformer_blocks[i].ff.net[2])
+        update_linear_weight(gm.transformer_blocks[i].attn1.to_qkv, [
+            m.transformer_blocks[i].attn1.to_q,
+            m.transformer_blocks[i].attn1.to_k,
+            m.transformer_blocks[i].attn1.to_v
+        ])
+        update_linear_weight(gm.transformer_blocks[i].attn1.to_out,
+                             m.transformer_blocks[i].attn1.to_out[0])
+
+        update_linear_weight(gm.transformer_blocks[i].attn2.to_q,
+                             m.transformer_blocks[i].attn2.to_q)
+        update_linear_weight(gm.transformer_blocks[i].attn2.to_kv, [
+            m.transformer_blocks[i].attn2.to_k,
+            m.transformer_blocks[i].attn2.to_v
+        ])
+        update_linear_weight(gm.transformer_blocks[i].attn2.to_out,
+                             m.transformer_blocks[i].attn2.to_out[0])
+
+        update_linear_weight(gm.transformer_blocks[i].ff.proj_in,
+                             m.transformer_blocks[i].ff.net[0].proj)
+        update_linear_weight(gm.transformer_blocks[i].ff.proj_out,
+                             m.transformer_blocks[i].ff.net[2])
 
         gm.transformer_blocks[i].norm1.update_parameters(
             m.transformer_blocks[i].norm1)
@@ -67,7 +102,7 @@ def update_transformer_2d_model_weight(gm, m):
         gm.transformer_blocks[i].norm3.update_parameters(
             m.transformer_blocks[i].norm3)
 
-    gm.proj_out.update_parameters(m.proj_out)
+    update_linear_weight(gm.proj_out, m.proj_out)
 
 
 def update_upblock_2d_weight(src, dst):
@@ -65,3 +65,98 @@ class TestFGroupNorm(unittest.TestCase):
 
         # compare diff
         torch.testing.assert_close(ref, outputs['output'], atol=1e-2, rtol=1e-2)
+
+    @parameterized.expand([('float32', ), ('float16', )],
+                          name_func=unittest_name_func)
+    def test_group_norm_silu(self, dtype):
+        # test data
+        num_channels = 6
+        num_groups = 3
+        x_shape = (2, num_channels, 3, 3)
+        torch_dtype = tensorrt_llm._utils.str_dtype_to_torch(dtype)
+        x_data = torch.rand(x_shape, dtype=torch_dtype, device="cuda")
+        weight_data = torch.rand((num_channels, ),
+                                 dtype=torch_dtype,
+                                 device="cuda")
+        bias_data = torch.rand((num_channels, ),
+                               dtype=torch_dtype,
+                               device="cuda")
+
+        # construct trt network
+        builder = tensorrt_llm.Builder()
+        network = builder.create_network()
+        with tensorrt_llm.net_guard(network):
+
+            x = Tensor(name='x',
+                       shape=x_shape,
+                       dtype=tensorrt_llm.str_dtype_to_trt(dtype))
+            weight = Tensor(name='weight',
+                            shape=(num_channels, ),
+                            dtype=tensorrt_llm.str_dtype_to_trt(dtype))
+            bias = Tensor(name='bias',
+                          shape=(num_channels, ),
+                          dtype=tensorrt_llm.str_dtype_to_trt(dtype))
+            output = tensorrt_llm.functional.group_norm_silu(
+                x, num_groups, weight, bias)
+            output.mark_output('output', dtype)
+
+        # trt run
+        session = create_session(builder, network, precision=dtype)
+        inputs = {
+            'x': x_data,
+            'weight': weight_data,
+            'bias': bias_data,
+        }
+        outputs = run_session(session, inputs)
+
+        # pytorch run
+        ref = torch.nn.functional.silu(
+            torch.nn.functional.group_norm(x_data, num_groups, weight_data,
+                                           bias_data))
+
+        # compare diff
+        torch.testing.assert_close(ref, outputs['output'], atol=1e-2, rtol=1e-2)
+
+    @parameterized.expand([('float32', ), ('float16', )],
+                          name_func=unittest_name_func)
+    def test_group_norm_silu_residual(self, dtype):
+        # test data, the residual broadcasts over the spatial dims like the
+        # time embedding in the UNet resnet blocks
+        num_channels = 6
+        num_groups = 3
+        x_shape = (2, num_channels, 3, 3)
+        r_shape = (2, num_channels, 1, 1)
+        torch_dtype = tensorrt_llm._utils.str_dtype_to_torch(dtype)
+        x_data = torch.rand(x_shape, dtype=torch_dtype, device="cuda")
+        r_data = torch.rand(r_shape, dtype=torch_dtype, device="cuda")
+
+        # construct trt network
+        builder = tensorrt_llm.Builder()
+        network = builder.create_network()
+        with tensorrt_llm.net_guard(network):
+
+            x = Tensor(name='x',
+                       shape=x_shape,
+                       dtype=tensorrt_llm.str_dtype_to_trt(dtype))
+            r = Tensor(name='r',
+                       shape=r_shape,
+                       dtype=tensorrt_llm.str_dtype_to_trt(dtype))
+            output = tensorrt_llm.functional.group_norm_silu(x,
+                                                             num_groups,
+                                                             residual=r)
+            output.mark_output('output', dtype)
+
+        # trt run
+        session = create_session(builder, network, precision=dtype)
+        inputs = {
+            'x': x_data,
+            'r': r_data,
+        }
+        outputs = run_session(session, inputs)
+
+        # pytorch run
+        ref = torch.nn.functional.silu(
+            torch.nn.functional.group_norm(x_data + r_data, num_groups))
+
+        # compare diff
+        torch.testing.assert_close(ref, outputs['output'], atol=1e-2, rtol=1e-2)
@@ -0,0 +1,220 @@
+# SPDX-FileCopyrightText: Copyright (c) 2022-2024 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import sys
+import unittest
+
+import numpy as np
+import torch
+
+import tensorrt_llm
+from tensorrt_llm import Tensor
+from tensorrt_llm._utils import (numpy_to_torch, str_dtype_to_np,
+                                 str_dtype_to_trt, torch_dtype_to_trt)
+from tensorrt_llm.models.unet.unet_2d_condition import UNet2DConditionModel
+from tensorrt_llm.models.unet.weights import FP8_E4M3_MAX, update_linear_weight
+from tensorrt_llm.network import net_guard
+from tensorrt_llm.quantization.layers import FP8Linear
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from utils.util import create_session, run_session
+
+
+def create_tiny_unet(dtype='float32', **kwargs):
+    model = UNet2DConditionModel(
+        sample_size=8,
+        down_block_types=("DownBlock2D", "CrossAttnDownBlock2D"),
+        up_block_types=("CrossAttnUpBlock2D", "UpBlock2D"),
+        block_out_channels=(32, 64),
+        layers_per_block=1,
+        cross_attention_dim=32,
+        attention_head_dim=2,
+        dtype=str_dtype_to_trt(dtype),
+        **kwargs,
+    )
+    # the same weights for every instance
+    rng = np.random.default_rng(0)
+    for _, param in model.named_parameters():
+        param.value = (0.1 * rng.standard_normal(param.shape)).astype(
+            str_dtype_to_np(dtype))
+    return model
+
+
+class TestUNet2DConditionModel(unittest.TestCase):
+
+    def setUp(self):
+        torch.manual_seed(42)
+        tensorrt_llm.logger.set_level('error')
+
+    def run_unet(self,
+                 inputs,
+                 dtype='float32',
+                 return_cached_feature=False,
+                 return_mid_block_cache=False,
+                 **kwargs):
+        # Parameters are bound to the network they are first used in, so
+        # every network gets its own model instance.
+        model = create_tiny_unet(dtype, **kwargs)
+        builder = tensorrt_llm.Builder()
+        network = builder.create_network()
+        with net_guard(network):
+            network.set_named_parameters(model.named_parameters())
+            tensors = {
+                name: Tensor(name=name,
+                             shape=tuple(value.shape),
+                             dtype=torch_dtype_to_trt(value.dtype))
+                for name, value in inputs.items()
+            }
+            outputs = model(tensors['sample'],
+                            tensors['timesteps'],
+                            tensors['encoder_hidden_states'],
+                            text_embeds=tensors.get('text_embeds'),
+                            time_ids=tensors.get('time_ids'),
+                            cached_feature=tensors.get('cached_feature'),
+                            return_cached_feature=return_cached_feature,
+                            mid_block_cache=tensors.get('mid_block_cache'),
+                            return_mid_block_cache=return_mid_block_cache)
+
+            output_names = ['pred']
+            if return_cached_feature:
+                output_names.append('deep_feature')
+            if return_mid_block_cache:
+                output_names.append('mid_block_cache')
+            if len(output_names) == 1:
+                outputs = (outputs, )
+            for name, output in zip(output_names, outputs):
+                output.mark_output(name, dtype)
+
+        session = create_session(builder, network, precision=dtype)
+        return run_session(session, inputs)
+
+    def test_upblock_skip_ranges(self):
+        model = create_tiny_unet()
+        num_res_samples = 1 + sum(
+            len(block.resnets) + (block.downsamplers is not None)
+            for block in model.down_blocks)
+
+        # the up blocks consume the skip connections from the end, the
+        # ranges tile [0, num_res_samples)
+        ranges = model.upblock_skip_ranges
+        self.assertEqual(len(ranges), len(model.up_blocks))
+        self.assertEqual(ranges[0][1], num_res_samples)
+        for (start, _), (_, end) in zip(ranges, ranges[1:]):
+            self.assertEqual(start, end)
+        self.assertEqual(ranges[-1][0], 0)
+        for block, (start, end) in zip(model.up_blocks, ranges):
+            self.assertEqual(end - start, len(block.resnets))
+
+    def test_cached_features(self):
+        inputs = {
+            'sample': torch.randn(2, 4, 8, 8, device='cuda'),
+            'timesteps': torch.tensor([500.0, 500.0], device='cuda'),
+            'encoder_hidden_states': torch.randn(2, 7, 32, device='cuda'),
+        }
+        full = self.run_unet(inputs,
+                             return_cached_feature=True,
+                             return_mid_block_cache=True)
+
+        # DeepCache: the shallow path on the deep feature of the same step
+        shallow = self.run_unet(
+            dict(inputs, cached_feature=full['deep_feature']))
+        torch.testing.assert_close(shallow['pred'],
+                                   full['pred'],
+                                   atol=1e-3,
+                                   rtol=1e-3)
+
+        # mid-block skip: the mid block residual of the same step
+        nomid = self.run_unet(
+            dict(inputs, mid_block_cache=full['mid_block_cache']))
+        torch.testing.assert_close(nomid['pred'],
+                                   full['pred'],
+                                   atol=1e-3,
+                                   rtol=1e-3)
+
+    def test_text_time_embedding(self):
+        # text_embeds and the sinusoids of time_ids are concatenated without
+        # a cast, both have to come out in float16
+        dtype = torch.float16
+        inputs = {
+            'sample':
+            torch.randn(2, 4, 8, 8, dtype=dtype, device='cuda'),
+            'timesteps':
+            torch.tensor([500.0, 500.0], dtype=dtype, device='cuda'),
+            'encoder_hidden_states':
+            torch.randn(2, 7, 32, dtype=dtype, device='cuda'),
+            'text_embeds':
+            torch.randn(2, 32, dtype=dtype, device='cuda'),
+            'time_ids':
+            torch.tensor([[8.0, 8.0, 0.0, 0.0, 8.0, 8.0]] * 2,
+                         dtype=dtype,
+                         device='cuda'),
+        }
+        # text_embeds followed by the embeddings of the 6 time ids
+        add_embeds_dim = 32 + 6 * 8
+        outputs = self.run_unet(
+            inputs,
+            dtype='float16',
+            addition_embed_type="text_time",
+            addition_time_embed_dim=8,
+            projection_class_embeddings_input_dim=add_embeds_dim)
+        pred = outputs['pred']
+        self.assertEqual(pred.dtype, dtype)
+        self.assertEqual(tuple(pred.shape), (2, 4, 8, 8))
+        self.assertTrue(torch.isfinite(pred).all())
+
+
+class TestUNetWeights(unittest.TestCase):
+
+    def setUp(self):
+        torch.manual_seed(42)
+        tensorrt_llm.logger.set_level('error')
+
+    def test_fp8_fused_qkv(self):
+        in_features = 16
+        out_features = 8
+        src = [torch.nn.Linear(in_features, out_features) for _ in range(3)]
+        for m, amax in zip(src, [1.0, 3.0, 2.0]):
+            m.input_amax = amax
+        dst = FP8Linear(in_features, 3 * out_features, dtype='float32')
+
+        update_linear_weight(dst, src)
+
+        # per-tensor weight scale over the fused weight
+        weight = torch.cat([m.weight.detach() for m in src])
+        weights_scaling_factor = weight.abs().max() / FP8_E4M3_MAX
+        np.testing.assert_allclose(dst.weights_scaling_factor.raw_value,
+                                   [weights_scaling_factor.item()],
+                                   rtol=1e-6)
+        ref = (weight / weights_scaling_factor).to(torch.float8_e4m3fn)
+        torch.testing.assert_close(
+            numpy_to_torch(dst.weight.raw_value).float(), ref.float())
+
+        # the fused layer shares one activation scale, the largest range wins
+        np.testing.assert_allclose(dst.activation_scaling_factor.raw_value,
+                                   [3.0 / FP8_E4M3_MAX],
+                                   rtol=1e-6)
+
+        bias = torch.cat([m.bias.detach() for m in src])
+        np.testing.assert_allclose(dst.bias.raw_value, bias.numpy())
+
+    def test_fp8_requires_calibration(self):
+        src = torch.nn.Linear(16, 8)
+        dst = FP8Linear(16, 8, dtype='float32')
+        with self.assertRaises(AssertionError):
+            update_linear_weight(dst, src)
+
+
+if __name__ == '__main__':
+    unittest.main()
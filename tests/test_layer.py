@@ -754,6 +754,39 @@ class TestLayer(unittest.TestCase):
                                    outputs['output'],
                                    atol=1e-6)
 
+    def test_silu(self):
+        # test data
+        dtype = 'float32'
+        x_data = torch.randn(2, 2, 3, 6)
+        m = torch.nn.SiLU()
+        # construct trt network
+        builder = tensorrt_llm.Builder()
+        net = builder.create_network()
+        with tensorrt_llm.net_guard(net):
+            network = tensorrt_llm.default_trtnet()
+            x = Tensor(name='x',
+                       shape=x_data.shape,
+                       dtype=tensorrt_llm.str_dtype_to_trt(dtype))
+
+            silu = tensorrt_llm.layers.SiLU()
+            output = silu.forward(x).trt_tensor
+            output.name = 'output'
+            network.mark_output(output)
+
+        # trt run
+        build_engine = EngineFromNetwork((builder.trt_builder, net.trt_network))
+        with TrtRunner(build_engine) as runner:
+            outputs = runner.infer(feed_dict={'x': x_data.numpy()})
+
+        # pytorch run
+        with torch.no_grad():
+            ref = m(x_data)
+
+        # compare diff
+        np.testing.assert_allclose(ref.cpu().numpy(),
+                                   outputs['output'],
+                                   atol=1e-6)
+
     # The activation memory usage baseline is acquired by `session.engine.device_memory_size` and hardcoded here since it shouldn't change much across platforms if we fused mha successfully.
     @parameterized.expand(
         [